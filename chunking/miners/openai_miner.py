@@ -1,17 +1,56 @@
 import os
+import asyncio
+from functools import lru_cache
 import openai
 from dotenv import load_dotenv, find_dotenv
 from chunking.protocol import chunkSynapse
-import json
-from sr25519 import sign
+import orjson
+from chunking.utils.signing import sign_response
 import bittensor as bt
-from retry import retry
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception_type,
+    stop_after_attempt,
+    stop_before_delay,
+    wait_random_exponential,
+)
+from typing import List, Optional, Tuple
 
 
 class OpenAIError(Exception):
     pass
 
 
+SYSTEM_PROMPT = """
+用户会提供一些文本，请对用户提供的文本内容分块
+要求：
+1. 把文本分成{chunk_qty}个块，每个块不能超过{chunk_size}字符，不能有空块
+2. 不要任何分析，直接给我分块结果
+3. 分析结果请以json字符串方式返回给我，返回数据格式样例：{{"chunks":["hello","world"]}}
+"""
+
+BATCH_SYSTEM_PROMPT = """
+用户会提供一个JSON数组，每个元素包含id、doc（待分块的文本）、chunk_size和chunk_qty，请分别对每个doc的文本内容分块
+要求：
+1. 把每个doc分成chunk_qty个块，每个块不能超过chunk_size字符，不能有空块
+2. 不要任何分析，直接给我分块结果
+3. 分析结果请以json字符串方式返回给我，每个doc的结果用对应的id标识，返回数据格式样例：{"results":[{"id":0,"chunks":["hello","world"]}]}
+"""
+
+
+@lru_cache(maxsize=256)
+def system_prompt_for(chunk_qty: int, chunk_size: int) -> str:
+    """
+    Returns the single-document system prompt. Validators reuse a small set of
+    (chunk_qty, chunk_size) pairs, so the formatted prompts are cached.
+    """
+    return SYSTEM_PROMPT.format(chunk_qty=chunk_qty, chunk_size=chunk_size)
+
+
+# Keeps references to in-flight batch tasks so they are not garbage collected.
+_batch_tasks = set()
+
+
 def miner_init(self):
     """
     Initializes the miner. This function is called once when the miner is created.
@@ -21,57 +60,200 @@ def miner_init(self):
     base_url = os.environ.get("OPENAI_API_BASE", "")
 
     # Set openai key and other args
-    self.model = openai.OpenAI(
+    # Retries are handled in chunk_documents, within the request's deadline.
+    self.model = openai.AsyncOpenAI(
         api_key=api_key,
         base_url=base_url,
+        max_retries=0,
     )
 
+    # Requests arriving within the batch window can be sent to the model in one call.
+    # This is off by default: the output is roughly every document written back out,
+    # so a batch mostly saves the system prompt while each caller waits for all of it.
+    self.batch_size = int(os.environ.get("OPENAI_BATCH_SIZE", 1))
+    self.batch_window = float(os.environ.get("OPENAI_BATCH_WINDOW_MS", 50)) / 1000
+    # The queue is created on first use so that it belongs to the axon's event loop.
+    self.batch_queue = None
 
-@retry(
-    tries=3,
-    delay=1,
-    backoff=2,
-)
-def miner_process(self, synapse: chunkSynapse) -> chunkSynapse:
-    system_prompt = f"""
-用户会提供一些文本，请对用户提供的文本内容分块
-要求：
-1. 把文本分成{synapse.chunk_qty}个块，每个块不能超过{synapse.chunk_size}字符，不能有空块
-2. 不要任何分析，直接给我分块结果
-3. 分析结果请以json字符串方式返回给我，返回数据格式样例：{{"chunks":["hello","world"]}}
-"""
-    user_prompt = synapse.document
+    # Read the hotkey once instead of on every signed response.
+    hotkey = self.wallet.get_hotkey()
+    self.signing_key = (hotkey.public_key, hotkey.private_key)
+
+
+async def miner_process(self, synapse: chunkSynapse) -> chunkSynapse:
+    loop = asyncio.get_running_loop()
+    # Leave some of the soft time limit, counted from arrival, for signing and the reply.
+    # Organic requests carry no time_soft_max, so fall back to the hard timeout.
+    budget = synapse.time_soft_max or synapse.timeout
+    deadline = loop.time() + budget * 0.8 if budget else None
+
+    if self.batch_size > 1:
+        if self.batch_queue is None:
+            self.batch_queue = asyncio.Queue()
+            _spawn(batch_worker(self))
+        future = loop.create_future()
+        await self.batch_queue.put((synapse, future, deadline))
+        synapse.chunks = await future
+    else:
+        (chunks,) = await chunk_documents(self, [synapse], deadline)
+        if not chunks:
+            raise ValueError("Response does not contain 'chunks' or 'chunks' is empty")
+        synapse.chunks = chunks
+
+    synapse.miner_signature = sign_response(
+        self.signing_key,
+        synapse,
+    )
+
+    return synapse
+
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _batch_tasks.add(task)
+    task.add_done_callback(_batch_tasks.discard)
+
+
+async def batch_worker(self):
+    """
+    Collects queued requests into batches of up to `batch_size` items, waiting at most
+    `batch_window` seconds after the first one, and dispatches each batch.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await self.batch_queue.get()]
+        deadline = loop.time() + self.batch_window
+        while len(batch) < self.batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.batch_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        _spawn(process_batch(self, batch))
+
+
+async def process_batch(
+    self, batch: List[Tuple[chunkSynapse, asyncio.Future, Optional[float]]]
+):
+    """
+    Chunks a batch of documents and resolves the future of each request.
+    """
+    deadlines = [deadline for _, _, deadline in batch if deadline is not None]
+    try:
+        results = await chunk_documents(
+            self,
+            [synapse for synapse, _, _ in batch],
+            min(deadlines) if deadlines else None,
+        )
+    except Exception as e:
+        for _, future, _ in batch:
+            if not future.done():
+                future.set_exception(e)
+        return
+
+    for (_, future, _), chunks in zip(batch, results):
+        if future.done():
+            continue
+        if not chunks:
+            future.set_exception(
+                ValueError("Response does not contain 'chunks' or 'chunks' is empty")
+            )
+        else:
+            future.set_result(chunks)
+
+
+async def chunk_documents(
+    self, synapses: List[chunkSynapse], deadline: Optional[float] = None
+) -> List[List[str]]:
+    """
+    Asks the model to chunk the documents of the given synapses. A single document uses
+    the plain prompt; several documents are sent together as a JSON array.
+
+    Transient API failures are retried, but no attempt runs past `deadline`, an event
+    loop time. Without a deadline the call is tried at most three times.
+
+    Returns:
+        List[List[str]]: The chunks of each document, in order. Documents missing from
+        the response get an empty list.
+    """
+    if len(synapses) == 1:
+        synapse = synapses[0]
+        system_prompt = system_prompt_for(synapse.chunk_qty, synapse.chunk_size)
+        user_prompt = synapse.document
+    else:
+        system_prompt = BATCH_SYSTEM_PROMPT
+        user_prompt = orjson.dumps(
+            [
+                {
+                    "id": i,
+                    "doc": synapse.document,
+                    "chunk_size": synapse.chunk_size,
+                    "chunk_qty": synapse.chunk_qty,
+                }
+                for i, synapse in enumerate(synapses)
+            ]
+        ).decode()
     messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": user_prompt},
     ]
     model_name = os.environ.get("OPENAI_MODEL_NAME", "gpt-3.5-turbo")
 
-    response = self.model.chat.completions.create(
+    loop = asyncio.get_running_loop()
+    if deadline is None:
+        stop = stop_after_attempt(3)
+    else:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise asyncio.TimeoutError("Deadline passed before the model was called")
+        # Unlike stop_after_delay, this also refuses to sleep past the deadline.
+        stop = stop_before_delay(remaining)
+
+    async for attempt in AsyncRetrying(
+        wait=wait_random_exponential(min=0.2, max=4),
+        stop=stop,
+        retry=retry_if_exception_type(
+            (openai.APIConnectionError, openai.RateLimitError)
+        ),
+        reraise=True,
+    ):
+        with attempt:
+            # Bound each attempt by the time left; APITimeoutError is a connection error.
+            timeout = (
+                deadline - loop.time() if deadline is not None else openai.NOT_GIVEN
+            )
+            response = await complete(self, model_name, messages, timeout)
+
+    content = orjson.loads(response)
+
+    if len(synapses) == 1:
+        return [content.get("chunks", [])]
+
+    chunks_by_id = {}
+    for result in content.get("results", []):
+        if not isinstance(result, dict):
+            continue
+        # Models sometimes echo the id back as a string.
+        try:
+            chunks_by_id[int(result.get("id"))] = result.get("chunks", [])
+        except (TypeError, ValueError):
+            continue
+    return [chunks_by_id.get(i, []) for i in range(len(synapses))]
+
+
+async def complete(self, model_name: str, messages: List[dict], timeout) -> str:
+    """
+    Requests a JSON completion from the model and returns its text.
+    """
+    response = await self.model.chat.completions.create(
         model=model_name,
         messages=messages,
         response_format={"type": "json_object"},
+        timeout=timeout,
     )
 
     bt.logging.debug(f"model response: {response}")
 
-    content = json.loads(response.choices[0].message.content)
-    chunks = content.get("chunks", [])
-
-    if not chunks:
-        raise ValueError("Response does not contain 'chunks' or 'chunks' is empty")
-
-    synapse.chunks = chunks
-
-    response_data = {
-        "document": synapse.document,
-        "chunk_size": synapse.chunk_size,
-        "chunk_qty": synapse.chunk_qty,
-        "chunks": synapse.chunks,
-    }
-    synapse.miner_signature = sign(
-        (self.wallet.get_hotkey().public_key, self.wallet.get_hotkey().private_key),
-        str.encode(json.dumps(response_data)),
-    ).hex()
-
-    return synapse
+    return response.choices[0].message.content
@@ -1,59 +1,218 @@
+import os
+import time
+import pickle
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import List
+
 import nltk
+import numpy as np
 from nltk.data import find
-from nltk.tokenize import sent_tokenize
 import bittensor as bt
 from chunking.protocol import chunkSynapse
-from nltk.tokenize import sent_tokenize
-import json
-from sr25519 import sign
+from chunking.utils.signing import sign_response
 
 
+@lru_cache(maxsize=None)
 def download_nltk_data(package_name):
+    """
+    Make sure an NLTK tokenizer package is available and return the path it was found
+    at. The lookup and any download happen at most once per process; later calls
+    return the cached path.
+
+    If NLTK_DATA is set, missing packages are downloaded into its first entry so
+    that a restarted miner finds them there instead of downloading again.
+    """
+    resource = f"tokenizers/{package_name}"
     try:
         # Try to find the package
-        find(f"tokenizers/{package_name}")
+        path = find(resource)
         bt.logging.debug(f"{package_name} already exists. No need to download.")
     except LookupError:
         # If the package doesn't exist, download it
         bt.logging.debug(f"{package_name} not found. Downloading...")
-        nltk.download(package_name, quiet=True)
+        nltk_data = os.environ.get("NLTK_DATA")
+        download_dir = nltk_data.split(os.pathsep)[0] if nltk_data else None
+        nltk.download(package_name, download_dir=download_dir, quiet=True)
+        path = find(resource)
         bt.logging.debug(f"{package_name} download completed.")
+    return path
 
 
-def miner_init(self):
+def load_tokenizer():
     """
-    Initialize the miner.
+    Loads the Punkt sentence tokenizer.
     """
-    download_nltk_data("punkt")
+    # Load from the resolved path; nltk.data.load would search NLTK_DATA again.
+    with download_nltk_data("punkt").join("english.pickle").open() as f:
+        return pickle.load(f)
 
 
-def miner_process(self, synapse: chunkSynapse) -> chunkSynapse:
+def pack_sentences(sentences: List[str], chunk_size: int) -> List[str]:
     """
-    Process the miner.
+    Greedily packs consecutive sentences, joined by spaces, into chunks of at most
+    `chunk_size` characters. A sentence longer than `chunk_size` becomes its own chunk.
     """
-    document = sent_tokenize(synapse.document)
+    n = len(sentences)
+    if n == 0:
+        return []
+
+    # cum[k] is the length of sentences[:k + 1] joined by spaces, plus one. Lengths are
+    # counted in characters, as the validator does when applying its size penalty;
+    # counting UTF-8 bytes would split non-ASCII text into needlessly small chunks.
+    cum = np.cumsum(
+        np.fromiter((len(s) + 1 for s in sentences), dtype=np.int64, count=n)
+    )
 
     chunks = []
-    while len(document) > 0:
-        chunks.append(document[0])
-        del document[0]
-        while len(document) > 0:
-            if len(chunks[-1] + " " + document[0]) > synapse.chunk_size:
+    start = 0
+    while start < n:
+        base = cum[start - 1] if start else 0
+        # Last sentence that keeps sentences[start:end] within chunk_size.
+        end = int(np.searchsorted(cum, base + chunk_size + 1, side="right"))
+        end = max(end, start + 1)
+        chunks.append(" ".join(sentences[start:end]))
+        start = end
+    return chunks
+
+
+# Default upper bound on tokenizer worker processes; override with PUNKT_WORKERS.
+DEFAULT_MAX_WORKERS = 4
+
+# Tokenizer of a pool worker process, set once by _worker_init.
+_worker_tokenizer = None
+
+
+def _worker_init(tokenizer):
+    global _worker_tokenizer
+    # The tokenizer is loaded by miner_init and pickled to each worker as it starts,
+    # so workers neither search for nor read the NLTK data themselves.
+    _worker_tokenizer = tokenizer
+
+
+def _worker_ready() -> int:
+    # Workers run their initializer before any task, so answering means this one is warm.
+    # The short sleep keeps it busy so that the other workers pick up warm-up tasks too.
+    time.sleep(0.05)
+    return os.getpid()
+
+
+def tokenize_and_pack(document: str, chunk_size: int) -> List[str]:
+    """
+    Splits a document into sentences and packs them into chunks. Runs in a pool worker.
+    """
+    return pack_sentences(_worker_tokenizer.tokenize(document), chunk_size)
+
+
+def start_tokenizer_pool(tokenizer, workers: int) -> ProcessPoolExecutor:
+    """
+    Starts a pool of `workers` tokenizer processes and waits until all of them are ready.
+    """
+    # Workers are spawned rather than forked because the axon runs in threads.
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_worker_init,
+        initargs=(tokenizer,),
+    )
+
+    # Start every worker now; a cold worker takes seconds to import and load Punkt,
+    # which would otherwise land on the first request it serves.
+    bt.logging.info(f"Starting {workers} tokenizer worker processes.")
+    ready = set()
+    while len(ready) < workers:
+        futures = [pool.submit(_worker_ready) for _ in range(workers)]
+        ready.update(future.result() for future in futures)
+    return pool
+
+
+def restart_tokenizer_pool(self, broken: ProcessPoolExecutor):
+    """
+    Replaces the tokenizer pool with a new one, unless another request already has.
+    """
+    with self.tokenizer_pool_lock:
+        if self.tokenizer_pool is not broken:
+            return
+        broken.shutdown(wait=False)
+        self.tokenizer_pool = start_tokenizer_pool(
+            self.tokenizer, self.tokenizer_workers
+        )
+
+
+async def tokenize(self, document: str, chunk_size: int) -> List[str]:
+    """
+    Splits a document into chunks in the worker pool.
+
+    A worker that dies, e.g. to the OOM killer, breaks the whole pool. The pool is then
+    restarted and the document retried once; if that fails too, the document is split
+    in this process so that the request is still answered.
+    """
+    loop = asyncio.get_running_loop()
+    for retry in (True, False):
+        pool = self.tokenizer_pool
+        try:
+            return await loop.run_in_executor(
+                pool, tokenize_and_pack, document, chunk_size
+            )
+        except BrokenProcessPool:
+            bt.logging.warning("The tokenizer pool is broken.")
+            if not retry:
+                break
+            try:
+                await loop.run_in_executor(None, restart_tokenizer_pool, self, pool)
+            except Exception as e:
+                bt.logging.error(f"Could not restart the tokenizer pool: {e}")
                 break
-            chunks[-1] += " " + document.pop(0)
 
-    synapse.chunks = chunks
+    bt.logging.warning("Tokenizing in the miner process.")
+    return await loop.run_in_executor(
+        None, lambda: pack_sentences(self.tokenizer.tokenize(document), chunk_size)
+    )
+
 
-    response_data = {
-        "document": synapse.document,
-        "chunk_size": synapse.chunk_size,
-        "chunk_qty": synapse.chunk_qty,
-        "chunks": synapse.chunks,
-    }
+def miner_init(self):
+    """
+    Initialize the miner.
+    """
+    # Load the tokenizer here, once, so that any NLTK data download happens before the
+    # workers start and a broken setup fails at startup.
+    self.tokenizer = load_tokenizer()
+
+    # Punkt is pure Python and holds the GIL, so concurrent requests are tokenized in
+    # separate processes. Every worker imports bittensor, so the default is capped.
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    self.tokenizer_workers = int(
+        os.environ.get("PUNKT_WORKERS", min(cpus, DEFAULT_MAX_WORKERS))
+    )
+    self.tokenizer_pool = start_tokenizer_pool(self.tokenizer, self.tokenizer_workers)
+    # Held while a broken pool is replaced, so that only one replacement is started.
+    self.tokenizer_pool_lock = threading.Lock()
+
+    # Read the hotkey once instead of on every signed response.
+    hotkey = self.wallet.get_hotkey()
+    self.signing_key = (hotkey.public_key, hotkey.private_key)
+
+
+async def miner_process(self, synapse: chunkSynapse) -> chunkSynapse:
+    """
+    Process the miner.
+    """
+    if synapse.document and len(synapse.document) <= synapse.chunk_size:
+        # The whole document fits in one chunk, so there is nothing to split.
+        synapse.chunks = [synapse.document]
+    else:
+        synapse.chunks = await tokenize(self, synapse.document, synapse.chunk_size)
 
-    synapse.miner_signature = sign(
-        (self.wallet.get_hotkey().public_key, self.wallet.get_hotkey().private_key),
-        str.encode(json.dumps(response_data)),
-    ).hex()
+    synapse.miner_signature = sign_response(
+        self.signing_key,
+        synapse,
+    )
 
     return synapse
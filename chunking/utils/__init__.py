@@ -1,3 +1,4 @@
 from . import config
 from . import misc
 from . import uids
+from . import signing
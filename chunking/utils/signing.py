@@ -0,0 +1,40 @@
+import json
+from typing import Tuple
+
+from sr25519 import sign
+
+from chunking.protocol import chunkSynapse
+
+
+def response_payload(synapse: chunkSynapse) -> bytes:
+    """Build the bytes a miner signs for its response.
+
+    This is exactly json.dumps({"document", "chunk_size", "chunk_qty", "chunks"}), which
+    is what the task API verifies `miner_signature` against, so the layout must not change.
+    Args:
+        synapse (chunkSynapse): The request with its chunks filled in.
+    Returns:
+        bytes: The payload to sign.
+    """
+    return json.dumps(
+        {
+            "document": synapse.document,
+            "chunk_size": synapse.chunk_size,
+            "chunk_qty": synapse.chunk_qty,
+            "chunks": synapse.chunks,
+        }
+    ).encode()
+
+
+def sign_response(
+    keypair: Tuple[bytes, bytes],
+    synapse: chunkSynapse,
+) -> str:
+    """Sign a miner response.
+    Args:
+        keypair (Tuple[bytes, bytes]): The hotkey's (public_key, private_key).
+        synapse (chunkSynapse): The request with its chunks filled in.
+    Returns:
+        str: The hex encoded signature.
+    """
+    return sign(keypair, response_payload(synapse)).hex()
@@ -17,8 +17,10 @@
 # DEALINGS IN THE SOFTWARE.
 
 
-import time
-from typing import List, Tuple
+import signal
+import threading
+import types
+from typing import List, Optional, Tuple
 
 import bittensor as bt
 import importlib
@@ -44,10 +46,30 @@ class Miner(BaseMinerNeuron):
             miner_name = f"chunking.miners.punkt_miner"
         miner_module = importlib.import_module(miner_name)
 
-        self.miner_init = miner_module.miner_init
-        self.miner_process = miner_module.miner_process
+        # Maps hotkeys to uids; rebuilt whenever a metagraph sync replaces its axons.
+        self._hotkey_to_uid = {}
+        self._hotkey_axons = None
+        # Stake of callers that passed blacklist, keyed by hotkey and consumed by priority.
+        self._caller_stake = {}
 
-        self.miner_init(self)
+        # Bind the backend functions as methods so they are called with this miner as `self`.
+        self.miner_init = types.MethodType(miner_module.miner_init, self)
+        self.miner_process = types.MethodType(miner_module.miner_process, self)
+
+        self.miner_init()
+
+    def _uid(self, hotkey: str) -> Optional[int]:
+        """
+        Returns the uid of the given hotkey in the metagraph, or None if it is not registered.
+        """
+        # hotkeys is built from axons, which sync replaces as a whole. Keying on the list
+        # itself rather than the block avoids caching old hotkeys under a new block when
+        # a request arrives while the main thread is part way through a sync.
+        axons = self.metagraph.axons
+        if axons is not self._hotkey_axons:
+            self._hotkey_to_uid = {axon.hotkey: uid for uid, axon in enumerate(axons)}
+            self._hotkey_axons = axons
+        return self._hotkey_to_uid.get(hotkey)
 
     async def forward(
         self, synapse: chunking.protocol.chunkSynapse
@@ -67,7 +89,7 @@ class Miner(BaseMinerNeuron):
             f"Chunk size: {synapse.chunk_size} Chunk qty: {synapse.chunk_qty} Time out: {synapse.time_soft_max}"
         )
 
-        return self.miner_process(self, synapse)
+        return await self.miner_process(synapse)
 
     async def blacklist(
         self, synapse: chunking.protocol.chunkSynapse
@@ -101,11 +123,8 @@ class Miner(BaseMinerNeuron):
 
         Otherwise, allow the request to be processed further.
         """
-        uid = self.metagraph.hotkeys.index(synapse.dendrite.hotkey)
-        if (
-            not synapse.dendrite.hotkey
-            or not synapse.dendrite.hotkey in self.metagraph.hotkeys
-        ):
+        uid = self._uid(synapse.dendrite.hotkey)
+        if not synapse.dendrite.hotkey or uid is None:
             if self.config.blacklist.allow_non_registered:
                 bt.logging.warning(
                     f"Accepting request from un-registered hotkey {synapse.dendrite.hotkey}"
@@ -118,6 +137,10 @@ class Miner(BaseMinerNeuron):
                 )
                 return True, "Unrecognized hotkey"
 
+        stake = self.metagraph.S[uid].item()
+        # priority runs next for accepted requests; let it reuse the stake.
+        self._caller_stake[synapse.dendrite.hotkey] = stake
+
         if not self.metagraph.validator_permit[uid]:
             if self.config.blacklist.force_validator_permit:
                 # Ignore request from non-validator
@@ -131,8 +154,6 @@ class Miner(BaseMinerNeuron):
                 )
                 return False, "Validator permit not required"
 
-        stake = self.metagraph.S[uid].item()
-
         if stake < self.config.blacklist.minimum_stake:
             # Ignore request from entity with insufficient stake.
             bt.logging.warning(
@@ -165,24 +186,29 @@ class Miner(BaseMinerNeuron):
         Example priority logic:
         - A higher stake results in a higher priority value.
         """
-        caller_uid = self.metagraph.hotkeys.index(
-            synapse.dendrite.hotkey
-        )  # Get the caller index.
-        priority = float(
-            self.metagraph.S[caller_uid]
-        )  # Return the stake as the priority.
+        priority = self._caller_stake.pop(synapse.dendrite.hotkey, None)
+        if priority is None:
+            caller_uid = self._uid(synapse.dendrite.hotkey)  # Get the caller index.
+            if caller_uid is None:
+                # Un-registered hotkeys only get here if allow_non_registered is set.
+                return 0.0
+            priority = float(
+                self.metagraph.S[caller_uid]
+            )  # Return the stake as the priority.
         bt.logging.debug(
             f"Prioritizing {synapse.dendrite.hotkey} with value: ", priority
         )
         return priority
 
     async def verify(self, synapse: chunking.protocol.chunkSynapse) -> None:
-        print("not verifying")
+        bt.logging.trace("not verifying")
 
 
 # This is the main function, which runs the miner.
 if __name__ == "__main__":
     with Miner() as miner:
-        while True:
-            # bt.logging.info("Miner running...", time.time())
-            time.sleep(10)
+        # Sleep until asked to stop instead of waking up periodically.
+        stop = threading.Event()
+        signal.signal(signal.SIGINT, lambda *_: stop.set())
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        stop.wait()
@@ -0,0 +1,100 @@
+import asyncio
+import os
+import random
+import signal
+import threading
+import types
+
+from chunking.miners.punkt_miner import pack_sentences, start_tokenizer_pool, tokenize
+
+
+class WordTokenizer:
+    """
+    A picklable stand-in for the Punkt tokenizer that splits on spaces.
+    """
+
+    def tokenize(self, text):
+        return text.split(" ")
+
+
+def greedy_pack(sentences, chunk_size):
+    """
+    The original punkt miner packer, kept as the reference behaviour.
+    """
+    document = list(sentences)
+    chunks = []
+    while len(document) > 0:
+        chunks.append(document[0])
+        del document[0]
+        while len(document) > 0:
+            if len(chunks[-1] + " " + document[0]) > chunk_size:
+                break
+            chunks[-1] += " " + document.pop(0)
+    return chunks
+
+
+def test_pack_sentences_edge_cases():
+    """
+    Test the packer on empty input, oversized sentences and exact-fit boundaries.
+    """
+    assert pack_sentences([], 10) == []
+
+    # A sentence longer than chunk_size becomes its own chunk.
+    assert pack_sentences(["x" * 20], 10) == ["x" * 20]
+    assert pack_sentences(["ab", "x" * 20, "cd"], 10) == ["ab", "x" * 20, "cd"]
+
+    # "aaaa bbbb" is exactly 9 characters, so it fits a chunk_size of 9 but not 8.
+    assert pack_sentences(["aaaa", "bbbb", "cc"], 9) == ["aaaa bbbb", "cc"]
+    assert pack_sentences(["aaaa", "bbbb", "cc"], 8) == ["aaaa", "bbbb cc"]
+    assert pack_sentences(["aaaa", "bbbb", "cc"], 12) == ["aaaa bbbb cc"]
+
+    for sentences, chunk_size in [
+        (["a"], 0),
+        (["a", "b"], -1),
+        (["", "", "a"], 1),
+        (["aaaa", "bbbb", "cc"], 9),
+    ]:
+        assert pack_sentences(sentences, chunk_size) == greedy_pack(
+            sentences, chunk_size
+        )
+
+
+def test_pack_sentences_matches_greedy_packer():
+    """
+    Test that the packer matches the original greedy packer on random input.
+    """
+    rng = random.Random(0)
+    for _ in range(2000):
+        sentences = ["x" * rng.randint(0, 30) for _ in range(rng.randint(0, 40))]
+        chunk_size = rng.randint(-2, 80)
+        assert pack_sentences(sentences, chunk_size) == greedy_pack(
+            sentences, chunk_size
+        )
+
+
+def test_tokenize_survives_a_killed_worker():
+    """
+    Test that requests are still answered after a tokenizer worker is killed, both when
+    the pool can be restarted and when it cannot.
+    """
+    tokenizer = WordTokenizer()
+    miner = types.SimpleNamespace(
+        tokenizer=tokenizer,
+        tokenizer_workers=2,
+        tokenizer_pool=start_tokenizer_pool(tokenizer, 2),
+        tokenizer_pool_lock=threading.Lock(),
+    )
+    try:
+        broken = miner.tokenizer_pool
+        os.kill(next(iter(broken._processes)), signal.SIGKILL)
+        for _ in range(3):
+            chunks = asyncio.run(tokenize(miner, "aaaa bbbb cc", 9))
+            assert chunks == ["aaaa bbbb", "cc"]
+        assert miner.tokenizer_pool is not broken
+
+        # A pool with no workers cannot be started, so the miner tokenizes itself.
+        miner.tokenizer_workers = 0
+        os.kill(next(iter(miner.tokenizer_pool._processes)), signal.SIGKILL)
+        assert asyncio.run(tokenize(miner, "aaaa bbbb cc", 8)) == ["aaaa", "bbbb cc"]
+    finally:
+        miner.tokenizer_pool.shutdown()
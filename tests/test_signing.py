@@ -0,0 +1,60 @@
+import json
+
+from sr25519 import pair_from_seed, verify
+
+from chunking.protocol import chunkSynapse
+from chunking.utils.signing import response_payload, sign_response
+
+
+def reference_payload(synapse: chunkSynapse) -> bytes:
+    """
+    The payload the task API verifies miner signatures against.
+    """
+    response_data = {
+        "document": synapse.document,
+        "chunk_size": synapse.chunk_size,
+        "chunk_qty": synapse.chunk_qty,
+        "chunks": synapse.chunks,
+    }
+    return str.encode(json.dumps(response_data))
+
+
+def make_synapses():
+    """
+    Synapses covering non-ASCII text, escapes and degenerate chunk lists.
+    """
+    return [
+        chunkSynapse(
+            document="Hello world.",
+            chunk_size=4096,
+            chunk_qty=2,
+            chunks=["Hello world."],
+        ),
+        chunkSynapse(
+            document='用户会提供一些文本 "quoted" \\ back\\slash\n\ttab é 🙂',
+            chunk_size=10,
+            chunk_qty=3,
+            chunks=["用户会提供一些文本", '"quoted" \\ back\\slash', "\n\ttab é 🙂"],
+        ),
+        chunkSynapse(document="", chunk_size=1, chunk_qty=1, chunks=[]),
+        chunkSynapse(document="empty", chunk_size=5, chunk_qty=1, chunks=None),
+        chunkSynapse(document="no size", chunks=["no size"]),
+    ]
+
+
+def test_response_payload_matches_json_dumps():
+    """
+    Test that the signed payload is byte-identical to json.dumps of the response.
+    """
+    for synapse in make_synapses():
+        assert response_payload(synapse) == reference_payload(synapse)
+
+
+def test_sign_response_verifies_against_json_dumps():
+    """
+    Test that signatures verify against the payload the task API rebuilds.
+    """
+    public_key, private_key = pair_from_seed(bytes(32))
+    for synapse in make_synapses():
+        signature = sign_response((public_key, private_key), synapse)
+        assert verify(bytes.fromhex(signature), reference_payload(synapse), public_key)